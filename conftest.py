@@ -2,6 +2,12 @@ import sys
 import pytest
 from _pytest.doctest import DoctestItem
 
+try:
+    import numba  # noqa: F401
+except ImportError:
+    # without Numba, its kernels cannot be imported to collect doctests
+    collect_ignore = ['upsetplot/_kernels.py']
+
 
 def pytest_runtest_setup(item):
     if isinstance(item, DoctestItem):
@@ -0,0 +1,34 @@
+"""Numba kernels, imported by reformat only when a large input needs them"""
+from __future__ import print_function, division, absolute_import
+
+import numba
+import numpy as np
+
+
+@numba.njit(cache=True, parallel=True)
+def _sum_by_code(values, codes, n_groups, n_chunks):
+    # each chunk of samples is accumulated into its own row
+    chunk_size = (len(codes) + n_chunks - 1) // n_chunks
+    partial = np.zeros((n_chunks, n_groups), dtype=values.dtype)
+    for chunk in numba.prange(n_chunks):
+        stop = min(len(codes), (chunk + 1) * chunk_size)
+        for i in range(chunk * chunk_size, stop):
+            partial[chunk, codes[i]] += values[i]
+    return partial.sum(axis=0)
+
+
+def sum_by_code(values, codes, n_groups):
+    return _sum_by_code(values, codes, n_groups, numba.get_num_threads())
+
+
+@numba.njit(cache=True, parallel=True)
+def popcount(packed):
+    out = np.empty(len(packed), dtype=np.int64)
+    for i in numba.prange(len(packed)):
+        value = np.uint64(packed[i])
+        count = 0
+        while value:
+            value &= value - np.uint64(1)
+            count += 1
+        out[i] = count
+    return out
@@ -1,12 +1,29 @@
 from __future__ import print_function, division, absolute_import
 from numbers import Number
-import functools
-from distutils.version import LooseVersion
+import itertools
 import warnings
 
 import pandas as pd
 import numpy as np
 
+from .reformat import _pack_binary, _unpack_binary, _indicators_to_index
+
+
+def _draw_samples(seed, n_samples, n_categories):
+    """Draw the scores and category indicators for generated samples
+
+    Returns
+    -------
+    scores : ndarray of shape (n_categories, n_samples)
+    indicators : ndarray of bool, shape (n_samples, n_categories)
+    """
+    rng = np.random.RandomState(seed)
+    # Each category draws n_samples scores and then a threshold, consuming
+    # the random stream in the same order as drawing them one at a time
+    draws = rng.rand(n_categories, n_samples + 1)
+    scores = draws[:, :-1]
+    return scores, (scores > draws[:, -1:]).T
+
 
 def generate_samples(seed=0, n_samples=10000, n_categories=3):
     """Generate artificial samples assigned to set intersections
@@ -34,16 +51,17 @@ def generate_samples(seed=0, n_samples=10000, n_categories=3):
     generate_counts : Generates the counts for each subset of categories
         corresponding to these samples.
     """
-    rng = np.random.RandomState(seed)
-    df = pd.DataFrame({'value': np.zeros(n_samples)})
-    for i in range(n_categories):
-        r = rng.rand(n_samples)
-        df['cat%d' % i] = r > rng.rand()
-        df['value'] += r
-
-    df.reset_index(inplace=True)
-    df.set_index(['cat%d' % i for i in range(n_categories)], inplace=True)
-    return df
+    scores, indicators = _draw_samples(seed, n_samples, n_categories)
+    index = _indicators_to_index(
+        indicators, ['cat%d' % i for i in range(n_categories)])
+    # add scores one category at a time, as sum(axis=0) would sum pairwise
+    # and round differently
+    value = np.zeros(n_samples)
+    for category_scores in scores:
+        value += category_scores
+    return pd.DataFrame({'index': np.arange(n_samples, dtype=np.int64),
+                         'value': value},
+                        index=index, columns=['index', 'value'])
 
 
 def generate_counts(seed=0, n_samples=10000, n_categories=3):
@@ -68,9 +86,20 @@ def generate_counts(seed=0, n_samples=10000, n_categories=3):
     generate_samples : Generates a DataFrame of samples that these counts are
         derived from.
     """
-    df = generate_samples(seed=seed, n_samples=n_samples,
-                          n_categories=n_categories)
-    return df.value.groupby(level=list(range(n_categories))).count()
+    _, indicators = _draw_samples(seed, n_samples, n_categories)
+    # count subsets by packed indicators, whose sorted order matches that of
+    # grouping by the boolean index levels
+    packed = _pack_binary(indicators)
+    if n_categories <= 16:
+        counts = np.bincount(packed, minlength=1 << n_categories)
+        keys = np.flatnonzero(counts)
+        counts = counts[keys]
+    else:
+        keys, counts = np.unique(packed, return_counts=True)
+    index = _indicators_to_index(
+        _unpack_binary(keys, n_categories),
+        ['cat%d' % i for i in range(n_categories)])
+    return pd.Series(counts, index=index, name='value')
 
 
 def generate_data(seed=0, n_samples=10000, n_sets=3, aggregated=False):
@@ -239,6 +268,36 @@ def _convert_to_pandas(data, copy=True):
     return data
 
 
+def _memberships_to_indicators(memberships):
+    """Get a boolean indicator matrix and its category names from memberships
+
+    Returns
+    -------
+    indicators : ndarray of bool
+        One row per membership and one column per category.
+    categories : Index
+        Category names, sorted.
+    """
+    memberships = [list(names) for names in memberships]
+    flat_names = list(itertools.chain.from_iterable(memberships))
+    if not flat_names:
+        raise ValueError('Require at least one category. None were found.')
+
+    # scatter the factorized names into a preallocated boolean matrix,
+    # rather than having pandas align one dict per membership
+    col_idx, categories = pd.factorize(
+        pd.Index(flat_names, dtype=object, tupleize_cols=False), sort=True)
+    # factorize drops missing names, which are not strings either
+    if (col_idx < 0).any() or not all(hasattr(name, 'lower')
+                                      for name in categories):
+        raise ValueError('Category names should be strings')
+    row_idx = np.repeat(np.arange(len(memberships)),
+                        [len(names) for names in memberships])
+    indicators = np.zeros((len(memberships), len(categories)), dtype=bool)
+    indicators[row_idx, col_idx] = True
+    return indicators, categories
+
+
 def from_memberships(memberships, data=None):
     """Load data where each sample has a collection of category names
 
@@ -291,29 +350,56 @@ def from_memberships(memberships, data=None):
     True  False False  6   7   8
     False False False  9  10  11
     """
-    df = pd.DataFrame([{name: True for name in names}
-                       for names in memberships])
-    for set_name in df.columns:
-        if not hasattr(set_name, 'lower'):
-            raise ValueError('Category names should be strings')
-    if df.shape[1] == 0:
-        raise ValueError('Require at least one category. None were found.')
-    df.sort_index(axis=1, inplace=True)
-    df.fillna(False, inplace=True)
-    df = df.astype(bool)
-    df.set_index(list(df.columns), inplace=True)
+    indicators, categories = _memberships_to_indicators(memberships)
+    index = _indicators_to_index(indicators, list(categories))
     if data is None:
-        return df.assign(ones=1)['ones']
+        return pd.Series(np.ones(len(index), dtype=np.int64), index=index,
+                         name='ones')
 
     data = _convert_to_pandas(data)
-    if len(data) != len(df):
+    if len(data) != len(index):
         raise ValueError('memberships and data must have the same length. '
                          'Got len(memberships) == %d, len(data) == %d'
                          % (len(memberships), len(data)))
-    data.index = df.index
+    data.index = index
     return data
 
 
+def _contents_to_indicators(contents):
+    """Convert a mapping of category names to ids into an indicator frame
+
+    The frame is indexed by id, in order of first appearance.
+    """
+    cat_names = []
+    cat_elements = []
+    for name, elements in contents.items():
+        cat_names.append(name)
+        cat_elements.append(list(elements))
+    if not cat_names:
+        raise ValueError('Require at least one category. None were found.')
+
+    flat_ids = pd.Index(list(itertools.chain.from_iterable(cat_elements)))
+    row_idx, ids = flat_ids.factorize()
+    missing = row_idx < 0
+    if missing.any():
+        # factorize drops missing ids, but they identify a row too
+        row_idx[missing] = len(ids)
+        ids = ids.append(flat_ids[missing][:1])
+    cat_sizes = np.array([len(elements) for elements in cat_elements],
+                         dtype=np.intp)
+    col_idx = np.repeat(np.arange(len(cat_names)), cat_sizes)
+    indicators = np.zeros((len(ids), len(cat_names)), dtype=bool)
+    indicators[row_idx, col_idx] = True
+    # a repeated (id, category) pair sets the same cell twice, so no set of
+    # ids needs to be built to find duplicates
+    is_dup = indicators.sum(axis=0) != cat_sizes
+    if is_dup.any():
+        raise ValueError('Got duplicate ids in a category: %r'
+                         % [name for name, dup in zip(cat_names, is_dup)
+                            if dup])
+    return pd.DataFrame(indicators, index=ids, columns=cat_names)
+
+
 def from_contents(contents, data=None, id_column='id'):
     """Build data from category listings
 
@@ -369,20 +455,9 @@ def from_contents(contents, data=None, id_column='id'):
     False True  False   3    yellow
           False True    4      blue
     """
-    cat_series = [pd.Series(True, index=list(elements), name=name)
-                  for name, elements in contents.items()]
-    if not all(s.index.is_unique for s in cat_series):
-        raise ValueError('Got duplicate ids in a category')
-
-    concat = pd.concat
-    if LooseVersion(pd.__version__) >= '0.23.0':
-        # silence the warning
-        concat = functools.partial(concat, sort=False)
-
-    df = concat(cat_series, axis=1)
+    df = _contents_to_indicators(contents)
     if id_column in df.columns:
         raise ValueError('A category cannot be named %r' % id_column)
-    df.fillna(False, inplace=True)
     cat_names = list(df.columns)
 
     if data is not None:
@@ -395,7 +470,9 @@ def from_contents(contents, data=None, id_column='id'):
         if len(not_in_data):
             raise ValueError('Found identifiers in contents that are not in '
                              'data: %r' % not_in_data.index.values)
-        df = df.reindex(index=data.index).fillna(False)
-        df = concat([data, df], axis=1)
-    df.index.name = id_column
+        indicators = df.reindex(index=data.index, fill_value=False)
+        df = data.copy(deep=False)
+        for name in cat_names:
+            df[name] = indicators[name].values
+    df.index = df.index.rename(id_column)
     return df.reset_index().set_index(cat_names)
@@ -13,7 +13,8 @@ from matplotlib import colors
 from matplotlib import patches
 from matplotlib.tight_layout import get_renderer
 
-from .reformat import query, _get_subset_mask
+from .reformat import (query, _get_subset_mask, _get_inclusion,
+                       _get_missing, _pack_binary)
 
 
 def _process_data(df, sort_by, sort_categories_by, subset_size,
@@ -32,20 +33,29 @@ def _process_data(df, sort_by, sort_categories_by, subset_size,
     total = agg.sum()
 
     # add '_bin' to df indicating index in agg
-    # XXX: ugly!
-    def _pack_binary(X):
-        X = pd.DataFrame(X)
-        out = 0
-        for i, (_, col) in enumerate(X.items()):
-            out *= 2
-            out += col
-        return out
-
-    df_packed = _pack_binary(df.index.to_frame())
-    data_packed = _pack_binary(agg.index.to_frame())
-    df['_bin'] = pd.Series(df_packed).map(
-        pd.Series(np.arange(len(data_packed))[::-1 if reverse else 1],
-                  index=data_packed))
+    inclusion = _get_inclusion(df.index)
+    missing = _get_missing(df.index)
+    if missing.any():
+        # rows missing a category's value are in no subset
+        inclusion = inclusion[~missing]
+    df_packed = _pack_binary(inclusion)
+    agg_packed = _pack_binary(_get_inclusion(agg.index))
+    if agg_packed.dtype.itemsize <= 2:
+        # look each sample up in a table over all possible subset keys
+        lookup = np.empty(1 << agg.index.nlevels, dtype=np.intp)
+        lookup[agg_packed] = np.arange(len(agg_packed))
+        bins = lookup[df_packed]
+    else:
+        agg_order = np.argsort(agg_packed)
+        bins = agg_order[np.searchsorted(agg_packed, df_packed,
+                                         sorter=agg_order)]
+    if reverse:
+        bins = len(agg) - 1 - bins
+    if missing.any():
+        bins_with_missing = np.full(len(df), np.nan)
+        bins_with_missing[~missing] = bins
+        bins = bins_with_missing
+    df['_bin'] = bins
     if reverse:
         agg = agg[::-1]
 
@@ -275,6 +285,9 @@ class UpSet:
                                       min_degree=min_degree,
                                       max_degree=max_degree,
                                       reverse=not self._horizontal)
+        # computed once for all calls to style_subsets
+        self._intersection_inclusion = _get_inclusion(
+            self.intersections.index)
         self.category_styles = {k: {"facecolor": self._shading_color}
                                 for k in self.totals.index}
         self.subset_styles = [{"facecolor": facecolor}
@@ -336,7 +349,8 @@ class UpSet:
                                 present=present, absent=absent,
                                 min_subset_size=min_subset_size,
                                 max_subset_size=max_subset_size,
-                                min_degree=min_degree, max_degree=max_degree)
+                                min_degree=min_degree, max_degree=max_degree,
+                                inclusion=self._intersection_inclusion)
         for idx in np.flatnonzero(mask):
             self.subset_styles[idx].update(style)
 
@@ -1,4 +1,5 @@
 from __future__ import print_function, division, absolute_import
+import numbers
 
 try:
     import typing
@@ -8,6 +9,131 @@ except ImportError:
 import numpy as np
 import pandas as pd
 
+# Below this many samples, Numba is no faster than NumPy. Numba is only
+# imported once an input this large is seen, and its kernels are compiled on
+# first use, which takes a few seconds unless they were cached on disk.
+_NUMBA_MIN_SAMPLES = 1000000
+
+_numba_kernels = None
+
+
+def _pack_binary(X):
+    """Pack each row of a boolean matrix into a single integer
+
+    The first column is the most significant bit.  Up to 64 columns are
+    packed into the narrowest sufficient unsigned integer dtype; wider
+    matrices fall back to Python integers.
+
+    Returns
+    -------
+    packed : ndarray
+        A contiguous array, which can be passed on to NumPy or Numba
+        without converting from a Series.
+    """
+    X = np.asarray(X, dtype=bool)
+    n_cols = X.shape[1]
+    if n_cols <= 64:
+        return _pack_binary_native(X)
+    # pack each 64 columns natively, then concatenate them as Python ints
+    packed = np.zeros(len(X), dtype=object)
+    for start in range(0, n_cols, 64):
+        chunk = X[:, start:start + 64]
+        packed = ((packed << chunk.shape[1])
+                  | _pack_binary_native(chunk).astype(object))
+    return packed
+
+
+def _pack_binary_native(X):
+    """Pack up to 64 boolean columns with a shift-OR reduction"""
+    n_cols = X.shape[1]
+    for dtype in [np.uint8, np.uint16, np.uint32, np.uint64]:
+        if n_cols <= np.iinfo(dtype).bits:
+            break
+    shifts = np.arange(n_cols - 1, -1, -1).astype(dtype)
+    return np.bitwise_or.reduce(X.astype(dtype) << shifts, axis=1)
+
+
+def _unpack_binary(packed, n_cols):
+    """Unpack integers packed by `_pack_binary` into a boolean matrix"""
+    packed = np.asarray(packed)
+    shifts = np.arange(n_cols - 1, -1, -1).astype(packed.dtype)
+    return ((packed[:, np.newaxis] >> shifts) & 1).astype(bool)
+
+
+def _indicators_to_index(indicators, names):
+    """Index rows by a boolean matrix, with one level per column
+
+    A single column gives a flat Index, as a one-level groupby would.
+    """
+    index = pd.MultiIndex.from_arrays(list(indicators.T), names=names)
+    if index.nlevels == 1:
+        index = index.get_level_values(0)
+    return index
+
+
+_POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)],
+                           dtype=np.uint8)
+
+
+def _get_numba_kernels(n_samples):
+    """Get the Numba kernels module for this many samples, if worthwhile"""
+    global _numba_kernels
+    if n_samples < _NUMBA_MIN_SAMPLES:
+        return None
+    if _numba_kernels is None:
+        try:
+            from . import _kernels as kernels
+        except ImportError:
+            kernels = False
+        _numba_kernels = kernels
+    return _numba_kernels or None
+
+
+def _popcount(packed):
+    """Count the bits set in each unsigned integer from `_pack_binary`"""
+    packed = np.ascontiguousarray(packed)
+    kernels = _get_numba_kernels(len(packed))
+    if kernels is not None:
+        return kernels.popcount(packed)
+    return (_POPCOUNT_TABLE[packed.view(np.uint8)]
+            .reshape(len(packed), packed.dtype.itemsize)
+            .sum(axis=1))
+
+
+def _get_sum_dtype(dtype):
+    """Get the dtype to accumulate sums in, widened as GroupBy.sum would"""
+    if dtype.kind in 'bi':
+        return np.dtype(np.int64)
+    if dtype.kind == 'u':
+        return np.dtype(np.uint64)
+    return dtype
+
+
+def _sum_by_code(values, codes, n_groups):
+    """Sum a Series by group code, as GroupBy.sum would
+
+    Each code in ``range(n_groups)`` must occur at least once.
+    """
+    array = values.values
+    if (not isinstance(array, np.ndarray)
+            or array.dtype.kind not in 'biuf' or not n_groups):
+        return values.groupby(codes).sum().values
+    dtype = _get_sum_dtype(array.dtype)
+    if array.dtype.kind == 'f':
+        array = np.where(np.isnan(array), 0, array)
+    elif (max(abs(float(array.min())), abs(float(array.max()))) * len(array)
+          >= 2 ** 53):
+        # float64 weights in bincount could not sum these exactly
+        return values.groupby(codes).sum().values
+
+    kernels = _get_numba_kernels(len(array))
+    if kernels is not None:
+        sums = kernels.sum_by_code(np.ascontiguousarray(array, dtype=dtype),
+                                   codes, n_groups)
+    else:
+        sums = np.bincount(codes, weights=array, minlength=n_groups)
+    return sums.astype(dtype, copy=False)
+
 
 def _aggregate_data(df, subset_size, sum_over):
     """
@@ -54,14 +180,28 @@ def _aggregate_data(df, subset_size, sum_over):
                                  'subset_size="sum" and a DataFrame is '
                                  'provided.')
 
-    gb = df.groupby(level=list(range(df.index.nlevels)), sort=False)
+    # number subsets by order of appearance, using one packed key per row
+    inclusion = _get_inclusion(df.index)
+    missing = _get_missing(df.index)
+    if missing.any():
+        # as groupby would, leave out rows missing a category's value
+        inclusion = inclusion[~missing]
+    key = _pack_binary(inclusion)
+    codes, uniques = pd.factorize(key)
     if sum_over is False:
-        aggregated = gb.size()
-        aggregated.name = 'size'
+        aggregated = pd.Series(np.bincount(codes, minlength=len(uniques)),
+                               name='size')
     elif hasattr(sum_over, 'lower'):
-        aggregated = gb[sum_over].sum()
+        values = df[sum_over]
+        if missing.any():
+            values = values[~missing]
+        aggregated = pd.Series(_sum_by_code(values, codes, len(uniques)),
+                               name=sum_over)
     else:
         raise ValueError('Unsupported value for sum_over: %r' % sum_over)
+    # index subsets by their unpacked keys, not by a lookup into all rows
+    aggregated.index = _indicators_to_index(
+        _unpack_binary(uniques, df.index.nlevels), df.index.names)
 
     if aggregated.name == '_value':
         aggregated.name = input_name
@@ -95,51 +235,126 @@ def _scalar_to_list(val):
     return val
 
 
+def _get_level_position(index, level):
+    """Get the position of an index level given by name or position"""
+    names = list(index.names)
+    if level in names:
+        return names.index(level)
+    if not isinstance(level, numbers.Integral):
+        raise KeyError('Level %s not found' % level)
+    position = level + index.nlevels if level < 0 else level
+    if not 0 <= position < index.nlevels:
+        raise IndexError('Too many levels: Index has only %d levels, '
+                         '%d is not a valid level number'
+                         % (index.nlevels, level))
+    return position
+
+
+def _get_level_bits(index, levels):
+    """Get the bits set in packed indicators for the given index levels"""
+    bits = 0
+    if levels is not None:
+        for level in _scalar_to_list(levels):
+            position = _get_level_position(index, level)
+            bits |= 1 << (index.nlevels - 1 - position)
+    return bits
+
+
+def _get_inclusion(index):
+    """Get the boolean matrix of category membership in an index
+
+    Missing values are False. Rows with any missing value, as found by
+    `_get_missing`, belong to no subset.
+    """
+    if not isinstance(index, pd.MultiIndex):
+        return np.asarray(index.to_frame(index=False).fillna(False),
+                          dtype=bool)
+    # convert each level's few distinct values, then look them up by code
+    # rather than materialising every value
+    codes = index.codes if hasattr(index, 'codes') else index.labels
+    # a code of -1 (missing) picks the trailing False
+    return np.column_stack([
+        np.append(np.asarray(level, dtype=bool), False)[level_codes]
+        for level, level_codes in zip(index.levels, codes)])
+
+
+def _get_missing(index):
+    """Get a mask of the rows of an index with any level's value missing"""
+    if not isinstance(index, pd.MultiIndex):
+        return np.asarray(pd.isnull(index))
+    codes = index.codes if hasattr(index, 'codes') else index.labels
+    missing = np.zeros(len(index), dtype=bool)
+    for level_codes in codes:
+        missing |= np.asarray(level_codes) < 0
+    return missing
+
+
 def _get_subset_mask(agg, min_subset_size, max_subset_size,
                      min_degree, max_degree,
-                     present, absent):
-    """Get a mask over subsets based on size, degree or category presence"""
+                     present, absent, inclusion=None):
+    """Get a mask over subsets based on size, degree or category presence
+
+    If given, `inclusion` should be ``_get_inclusion(agg.index)``, which
+    otherwise is computed when needed.
+    """
     subset_mask = True
     if min_subset_size is not None:
         subset_mask = np.logical_and(subset_mask, agg >= min_subset_size)
     if max_subset_size is not None:
         subset_mask = np.logical_and(subset_mask, agg <= max_subset_size)
     if (min_degree is not None and min_degree >= 0) or max_degree is not None:
-        degree = agg.index.to_frame().sum(axis=1)
+        if inclusion is None:
+            inclusion = _get_inclusion(agg.index)
+        degree = inclusion.sum(axis=1)
         if min_degree is not None:
             subset_mask = np.logical_and(subset_mask, degree >= min_degree)
         if max_degree is not None:
             subset_mask = np.logical_and(subset_mask, degree <= max_degree)
-    if present is not None:
-        for col in _scalar_to_list(present):
-            subset_mask = np.logical_and(
-                subset_mask,
-                agg.index.get_level_values(col).values)
-    if absent is not None:
-        for col in _scalar_to_list(absent):
-            exclude_mask = np.logical_not(
-                agg.index.get_level_values(col).values)
-            subset_mask = np.logical_and(subset_mask, exclude_mask)
+    if present is not None or absent is not None:
+        # test all present and absent categories at once on packed keys
+        if inclusion is None:
+            inclusion = _get_inclusion(agg.index)
+        packed = _pack_binary(inclusion)
+        present_bits = packed.dtype.type(_get_level_bits(agg.index, present))
+        absent_bits = packed.dtype.type(_get_level_bits(agg.index, absent))
+        if present_bits & absent_bits:
+            category_mask = np.zeros(len(agg), dtype=bool)
+        else:
+            category_mask = ((packed & (present_bits | absent_bits))
+                             == present_bits)
+        subset_mask = np.logical_and(subset_mask, category_mask)
     return subset_mask
 
 
 def _filter_subsets(df, agg,
                     min_subset_size, max_subset_size,
                     min_degree, max_degree,
-                    present, absent):
+                    present, absent, inclusion=None):
+    """Filter subsets, along with `inclusion` and samples of `df`
+
+    Returns
+    -------
+    df : DataFrame
+    agg : Series
+    inclusion : ndarray or None
+        Filtered like `agg`, if given.
+    """
     subset_mask = _get_subset_mask(agg,
                                    min_subset_size=min_subset_size,
                                    max_subset_size=max_subset_size,
                                    min_degree=min_degree,
                                    max_degree=max_degree,
-                                   present=present, absent=absent)
+                                   present=present, absent=absent,
+                                   inclusion=inclusion)
 
     if subset_mask is True:
-        return df, agg
+        return df, agg, inclusion
 
     agg = agg[subset_mask]
     df = df[df.index.isin(agg.index)]
-    return df, agg
+    if inclusion is not None:
+        inclusion = inclusion[np.asarray(subset_mask, dtype=bool)]
+    return df, agg, inclusion
 
 
 class QueryResult:
@@ -272,32 +487,57 @@ def query(data, present=None, absent=None,
 
     data, agg = _aggregate_data(data, subset_size, sum_over)
     data = _check_index(data)
-    totals = [agg[agg.index.get_level_values(name).values.astype(bool)].sum()
-              for name in agg.index.names]
+    inclusion = _get_inclusion(agg.index)
+    sizes = agg.values
+    if isinstance(sizes, np.ndarray) and sizes.dtype.kind in 'biuf':
+        # total each category with one product over the subsets' indicators
+        dtype = _get_sum_dtype(sizes.dtype)
+        if dtype.kind == 'f':
+            dtype = np.promote_types(dtype, np.float64)
+        sizes = sizes.astype(dtype)
+        if dtype.kind == 'f':
+            # like Series.sum, ignore NaN
+            sizes[np.isnan(sizes)] = 0
+        totals = np.dot(inclusion.T.astype(dtype), sizes)
+    else:
+        totals = [agg[inclusion[:, i]].sum()
+                  for i in range(inclusion.shape[1])]
     totals = pd.Series(totals, index=agg.index.names)
 
-    data, agg = _filter_subsets(data, agg,
-                                min_subset_size=min_subset_size,
-                                max_subset_size=max_subset_size,
-                                min_degree=min_degree,
-                                max_degree=max_degree,
-                                present=present, absent=absent)
+    data, agg, inclusion = _filter_subsets(data, agg,
+                                           min_subset_size=min_subset_size,
+                                           max_subset_size=max_subset_size,
+                                           min_degree=min_degree,
+                                           max_degree=max_degree,
+                                           present=present, absent=absent,
+                                           inclusion=inclusion)
 
     # sort:
     if sort_categories_by == 'cardinality':
         totals.sort_values(ascending=False, inplace=True)
     elif sort_categories_by is not None:
         raise ValueError('Unknown sort_categories_by: %r' % sort_categories_by)
+    # keep inclusion in step with the reordered levels, rather than
+    # recomputing it from the index
+    level_names = list(agg.index.names)
+    inclusion = inclusion[:, [level_names.index(name)
+                              for name in totals.index]]
     data = data.reorder_levels(totals.index.values)
     agg = agg.reorder_levels(totals.index.values)
 
     if sort_by == 'cardinality':
         agg = agg.sort_values(ascending=False)
     elif sort_by == 'degree':
-        index_tuples = sorted(agg.index,
-                              key=lambda x: (sum(x),) + tuple(reversed(x)))
-        agg = agg.reindex(pd.MultiIndex.from_tuples(index_tuples,
-                                                    names=agg.index.names))
+        # sort by degree, then by the last category, the one before, etc.
+        if inclusion.shape[1] <= 64:
+            # packing with the last category most significant gives a key
+            # with this order among subsets of equal degree
+            packed = _pack_binary(inclusion[:, ::-1])
+            order = np.lexsort([packed, _popcount(packed)])
+        else:
+            order = np.lexsort(np.vstack([inclusion.T,
+                                          inclusion.sum(axis=1)]))
+        agg = agg.iloc[order]
     elif sort_by is None:
         pass
     else:
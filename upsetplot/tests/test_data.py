@@ -2,11 +2,26 @@ from collections import OrderedDict
 import pytest
 import pandas as pd
 import numpy as np
-from distutils.version import LooseVersion
 from pandas.util.testing import (assert_series_equal, assert_frame_equal,
                                  assert_index_equal)
 from upsetplot import (from_memberships, from_contents, from_indicators,
-                       generate_data)
+                       generate_data, generate_samples)
+
+# distutils is deprecated (and removed in Python 3.12), so compare the
+# major and minor version numbers directly
+PANDAS_VERSION = tuple(int(part) for part in pd.__version__.split('.')[:2]
+                       if part.isdigit())
+
+
+def test_generate_samples_value():
+    # value adds up each category's score in turn
+    rng = np.random.RandomState(0)
+    expected = 0.
+    for _ in range(9):
+        expected += rng.rand()
+        rng.rand()  # threshold
+    out = generate_samples(seed=0, n_samples=1, n_categories=9)
+    assert out['value'].iloc[0] == expected
 
 
 @pytest.mark.parametrize('typ', [set, list, tuple, iter])
@@ -19,6 +34,10 @@ def test_from_memberships_no_data(typ):
         from_memberships([[1]])
     with pytest.raises(ValueError, match='strings'):
         from_memberships([[1, 'str']])
+    with pytest.raises(ValueError, match='strings'):
+        from_memberships([['str', None]])
+    # names are not coerced to str
+    assert from_memberships([[b'bytes']]).index.name == b'bytes'
     with pytest.raises(TypeError):
         from_memberships([1])
 
@@ -71,7 +90,7 @@ def test_from_memberships_with_data(data, ndim):
     assert out is not data  # make sure frame is copied
     if hasattr(data, 'loc') and np.asarray(data).dtype.kind in 'ifb':
         # but not deepcopied when possible
-        if LooseVersion(pd.__version__) > LooseVersion('0.35'):
+        if PANDAS_VERSION > (0, 35):
             assert out.values.base is np.asarray(data).base
     if ndim == 1:
         assert isinstance(out, pd.Series)
@@ -100,6 +119,7 @@ def test_from_contents_vs_memberships(data, typ, id_column):
                            index=['aa', 'bb', 'cc', 'dd', 'ee', 'ff'])
     baseline = from_contents(contents, data=data_df,
                              id_column=id_column)
+    assert data_df.index.name is None
     # compare from_contents to from_memberships
     expected = from_memberships(memberships=[{'cat1'},
                                              {'cat1'},
@@ -145,6 +165,14 @@ def test_from_contents(typ=set, id_column='id'):
     out.index = out.index.to_frame().set_index(['cat1', 'cat2', 'cat3']).index
     assert_frame_equal(out, baseline)
 
+    # missing ids are kept as ids
+    out = from_contents({'cat1': [1, np.nan], 'cat2': [np.nan]},
+                        id_column=id_column)
+    assert_frame_equal(out.reset_index(),
+                       pd.DataFrame({'cat1': [True, True],
+                                     'cat2': [False, True],
+                                     id_column: [1, np.nan]}))
+
 
 @pytest.mark.parametrize('id_column', ['id', 'blah'])
 def test_from_contents_invalid(id_column):
@@ -155,7 +183,9 @@ def test_from_contents_invalid(id_column):
         from_contents(contents,
                       data=pd.DataFrame({'cat1': [1, 2, 3, 4, 5]}),
                       id_column=id_column)
-    with pytest.raises(ValueError, match='duplicate ids'):
+    with pytest.raises(ValueError, match='at least one category'):
+        from_contents({}, id_column=id_column)
+    with pytest.raises(ValueError, match=r"duplicate ids.*\['cat2'\]"):
         from_contents({'cat1': ['aa', 'bb'],
                        'cat2': ['dd', 'dd']}, id_column=id_column)
     # category named id
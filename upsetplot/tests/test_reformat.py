@@ -1,9 +1,15 @@
+import subprocess
+import sys
+
 import pytest
+import numpy as np
 import pandas as pd
 from pandas.util.testing import assert_series_equal, assert_frame_equal
 
 from upsetplot import generate_counts, generate_samples
 from upsetplot import query
+from upsetplot import reformat
+from upsetplot.reformat import _pack_binary, _unpack_binary, _popcount
 
 # `query` is mostly tested through plotting tests, especially tests of
 # `_process_data` which cover sort_by, sort_categories_by, subset_size
@@ -43,3 +49,97 @@ def test_mece_queries(data, param_set):
     combined_sizes.sort_index(inplace=True)
     assert_series_equal(unfiltered_results.subset_sizes.sort_index(),
                         combined_sizes)
+
+
+def test_query_level_positions():
+    data = generate_counts()
+    by_name = query(data, present='cat2', absent=['cat0'],
+                    sort_categories_by=None)
+    for present, absent in [(2, [0]), (-1, ['cat0']), ('cat2', [-3])]:
+        result = query(data, present=present, absent=absent,
+                       sort_categories_by=None)
+        assert_series_equal(result.subset_sizes, by_name.subset_sizes)
+    with pytest.raises(KeyError):
+        query(data, present='unknown')
+    with pytest.raises(IndexError):
+        query(data, absent=3)
+
+
+@pytest.mark.parametrize('n_cols', [1, 8, 9, 64, 65])
+def test_pack_binary(n_cols):
+    rng = np.random.RandomState(0)
+    X = rng.rand(20, n_cols) > .5
+    expected = [int(''.join('1' if x else '0' for x in row), 2) for row in X]
+    packed = _pack_binary(pd.DataFrame(X))
+    assert packed.tolist() == expected
+    if n_cols <= 64:
+        assert packed.dtype.kind == 'u'
+    np.testing.assert_array_equal(_unpack_binary(packed, n_cols), X)
+
+
+@pytest.mark.parametrize('dtype', [np.int16, 'Int64', 'timedelta64[s]',
+                                   object])
+def test_category_totals_dtype(dtype):
+    if dtype == 'Int64' and not hasattr(pd, 'Int64Dtype'):
+        pytest.skip('nullable integers are not supported by this pandas')
+    # the total of cat2 exceeds the range of int16
+    data = generate_counts(n_samples=50000, n_categories=3)
+    if dtype == 'timedelta64[s]':
+        data = pd.to_timedelta(data, unit='s')
+    else:
+        data = data.astype(dtype)
+    result = query(data).category_totals
+    expected = pd.Series([data[data.index.get_level_values(name).values]
+                          .sum()
+                          for name in result.index],
+                         index=result.index)
+    assert_series_equal(result, expected, check_names=False)
+
+
+def test_missing_category_values():
+    # as with groupby, rows missing a category's value are in no subset
+    index = pd.MultiIndex.from_arrays([[True, False, True],
+                                       [True, False, np.nan]],
+                                      names=['x', 'y'])
+    data = pd.DataFrame({'value': [1, 2, 3]}, index=index)
+    for result in [query(data['value']),
+                   query(data, subset_size='sum', sum_over='value')]:
+        assert result.subset_sizes.to_dict() == {(False, False): 2,
+                                                 (True, True): 1}
+        assert result.category_totals.to_dict() == {'x': 1, 'y': 1}
+
+
+def test_numba_imported_lazily():
+    # importing Numba is slow, so only inputs large enough to use it do so
+    code = 'import sys, upsetplot; print("numba" in sys.modules)'
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert out.strip() == b'False'
+
+
+@pytest.mark.parametrize('use_numba', [False, True])
+@pytest.mark.parametrize('dtype', [float, np.int32, bool, np.uint8, np.int8])
+def test_sum_over(monkeypatch, use_numba, dtype):
+    if use_numba:
+        pytest.importorskip('numba')
+        monkeypatch.setattr(reformat, '_NUMBA_MIN_SAMPLES', 0)
+    data = generate_samples(n_samples=1000, n_categories=5)
+    data['value'] = (data['value'] * 10).astype(dtype)
+    result = query(data, subset_size='sum', sum_over='value').subset_sizes
+    expected = data.groupby(level=list(result.index.names))['value'].sum()
+    expected = expected.reindex(result.index)
+    assert_series_equal(result, expected, check_dtype=False,
+                        check_names=False)
+
+
+@pytest.mark.parametrize('use_numba', [False, True])
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16, np.uint64])
+def test_popcount(monkeypatch, use_numba, dtype):
+    if use_numba:
+        pytest.importorskip('numba')
+        monkeypatch.setattr(reformat, '_NUMBA_MIN_SAMPLES', 0)
+    rng = np.random.RandomState(0)
+    packed = rng.randint(0, np.iinfo(dtype).max, size=100,
+                         dtype=np.uint64).astype(dtype)
+    packed[0] = np.iinfo(dtype).max
+    expected = [bin(value).count('1') for value in packed.tolist()]
+    assert _popcount(packed).tolist() == expected
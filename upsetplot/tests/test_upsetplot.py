@@ -34,6 +34,8 @@ def get_all_texts(mpl_artist):
 @pytest.mark.parametrize('x', [
     generate_counts(),
     generate_counts().iloc[1:-2],
+    # too many categories to look subsets up in a table
+    generate_counts(n_samples=1000, n_categories=17),
 ])
 @pytest.mark.parametrize('sort_by', ['cardinality', 'degree', None])
 @pytest.mark.parametrize('sort_categories_by', [None, 'cardinality'])
@@ -91,6 +93,21 @@ def test_process_data_series(x, sort_by, sort_categories_by):
     assert len(df) == len(x)
 
 
+@pytest.mark.parametrize('reverse', [False, True])
+def test_process_data_missing_values(reverse):
+    index = pd.MultiIndex.from_arrays([[True, False, True],
+                                       [True, False, np.nan]],
+                                      names=['x', 'y'])
+    x = pd.Series([1, 2, 3], index=index)
+    total, df, intersections, totals = _process_data(
+        x, sort_by='degree', sort_categories_by=None, subset_size='auto',
+        sum_over=None, reverse=reverse)
+    assert total == 3
+    assert np.isnan(df['_bin'].iloc[2])
+    bins = df['_bin'].iloc[:2].astype(int)
+    assert_index_equal(intersections.iloc[bins].index, df.index[:2])
+
+
 @pytest.mark.parametrize('x', [
     generate_samples()['value'],
     generate_counts(),